@@ -1,76 +1,133 @@
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 import pikepdf
 from lxml import etree
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Define file names
-PDF_FILENAME = "invoice.pdf"
 XML_FILENAME = "invoice.xml"
 OUTPUT_PDF = "invoice_zugferd.pdf"
 INPUT_JSON = "invoice_data.json"
 
+# Set ZUGFERD_PRETTY=1 to indent the generated XML when debugging
+PRETTY_XML = os.environ.get("ZUGFERD_PRETTY") == "1"
+
+# ZUGFeRD namespaces and fully qualified tag names, built once at import
+RSM_NS = "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100"
+RAM_NS = "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100"
+NSMAP = {"rsm": RSM_NS, "ram": RAM_NS}
+
+RSM_INVOICE = f"{{{RSM_NS}}}CrossIndustryInvoice"
+RSM_CONTEXT = f"{{{RSM_NS}}}ExchangedDocumentContext"
+RSM_TRANSACTION = f"{{{RSM_NS}}}SupplyChainTradeTransaction"
+RAM_GUIDELINE = f"{{{RAM_NS}}}GuidelineSpecifiedDocumentContextParameter"
+RAM_ID = f"{{{RAM_NS}}}ID"
+RAM_AGREEMENT = f"{{{RAM_NS}}}ApplicableHeaderTradeAgreement"
+RAM_SELLER = f"{{{RAM_NS}}}SellerTradeParty"
+RAM_BUYER = f"{{{RAM_NS}}}BuyerTradeParty"
+RAM_NAME = f"{{{RAM_NS}}}Name"
+RAM_SETTLEMENT = f"{{{RAM_NS}}}ApplicableHeaderTradeSettlement"
+RAM_MONETARY = f"{{{RAM_NS}}}SpecifiedTradeSettlementMonetarySummation"
+RAM_LINE_TOTAL = f"{{{RAM_NS}}}LineTotalAmount"
+RAM_TAX_TOTAL = f"{{{RAM_NS}}}TaxTotalAmount"
+RAM_GRAND_TOTAL = f"{{{RAM_NS}}}GrandTotalAmount"
+
 # 1. Load Invoice Data from JSON
 def load_invoice_data(json_file):
+    if orjson is not None:
+        with open(json_file, "rb") as f:
+            return orjson.loads(f.read())
     with open(json_file, "r", encoding="utf-8") as f:
         return json.load(f)
 
 # 2. Generate ZUGFeRD XML Invoice
-def create_zugferd_xml(invoice_data, filename):
-    nsmap = {
-        "rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
-        "ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
-    }
+def create_zugferd_xml(invoice_data):
+    # Always create nodes in place with SubElement; appending elements built
+    # in a separate document makes lxml copy them across documents
+    SubElement = etree.SubElement
 
-    root = etree.Element("{urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100}CrossIndustryInvoice", nsmap=nsmap)
-    context = etree.SubElement(root, "rsm:ExchangedDocumentContext")
-    guid = etree.SubElement(context, "ram:GuidelineSpecifiedDocumentContextParameter")
-    etree.SubElement(guid, "ram:ID").text = "urn:factur-x:1.0:basic"
+    root = etree.Element(RSM_INVOICE, nsmap=NSMAP)
+    context = SubElement(root, RSM_CONTEXT)
+    guid = SubElement(context, RAM_GUIDELINE)
+    SubElement(guid, RAM_ID).text = "urn:factur-x:1.0:basic"
 
-    transaction = etree.SubElement(root, "rsm:SupplyChainTradeTransaction")
-    agreement = etree.SubElement(transaction, "ram:ApplicableHeaderTradeAgreement")
+    transaction = SubElement(root, RSM_TRANSACTION)
+    agreement = SubElement(transaction, RAM_AGREEMENT)
 
-    seller = etree.SubElement(agreement, "ram:SellerTradeParty")
-    etree.SubElement(seller, "ram:Name").text = invoice_data["seller"]["name"]
+    seller = SubElement(agreement, RAM_SELLER)
+    SubElement(seller, RAM_NAME).text = invoice_data["seller"]["name"]
 
-    buyer = etree.SubElement(agreement, "ram:BuyerTradeParty")
-    etree.SubElement(buyer, "ram:Name").text = invoice_data["buyer"]["name"]
+    buyer = SubElement(agreement, RAM_BUYER)
+    SubElement(buyer, RAM_NAME).text = invoice_data["buyer"]["name"]
 
-    settlement = etree.SubElement(transaction, "ram:ApplicableHeaderTradeSettlement")
-    monetary = etree.SubElement(settlement, "ram:SpecifiedTradeSettlementMonetarySummation")
-    etree.SubElement(monetary, "ram:LineTotalAmount", currencyID=invoice_data["currency"]).text = str(invoice_data["total_amount"])
-    etree.SubElement(monetary, "ram:TaxTotalAmount", currencyID=invoice_data["currency"]).text = str(invoice_data["total_vat"])
-    etree.SubElement(monetary, "ram:GrandTotalAmount", currencyID=invoice_data["currency"]).text = str(invoice_data["grand_total"])
+    settlement = SubElement(transaction, RAM_SETTLEMENT)
+    monetary = SubElement(settlement, RAM_MONETARY)
+    amount_attrib = {"currencyID": invoice_data["currency"]}
+    SubElement(monetary, RAM_LINE_TOTAL, amount_attrib).text = str(invoice_data["total_amount"])
+    SubElement(monetary, RAM_TAX_TOTAL, amount_attrib).text = str(invoice_data["total_vat"])
+    SubElement(monetary, RAM_GRAND_TOTAL, amount_attrib).text = str(invoice_data["grand_total"])
 
-    xml_tree = etree.ElementTree(root)
-    xml_tree.write(filename, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+    return etree.tostring(root, pretty_print=PRETTY_XML, xml_declaration=True, encoding="UTF-8")
 
 # 3. Generate PDF Invoice
-def create_pdf_invoice(invoice_data, filename):
-    c = canvas.Canvas(filename, pagesize=A4)
-    c.drawString(100, 750, f"Invoice #{invoice_data['invoice_number']}")
-    c.drawString(100, 730, f"Issue Date: {invoice_data['issue_date']}")
-    c.drawString(100, 710, f"Seller: {invoice_data['seller']['name']}")
-    c.drawString(100, 690, f"Buyer: {invoice_data['buyer']['name']}")
-    c.drawString(100, 670, f"Total: {invoice_data['grand_total']} {invoice_data['currency']}")
-
-    y = 650
-    for item in invoice_data["line_items"]:
-        c.drawString(100, y, f"{item['description']} - {item['quantity']} x {item['unit_price']} {invoice_data['currency']} (VAT {item['vat_rate']}%)")
-        y -= 20
-
-    c.drawString(100, y - 20, f"Payment Details: {invoice_data['payment_details']['bank_name']}")
-    c.drawString(100, y - 40, f"IBAN: {invoice_data['payment_details']['iban']}")
-    c.drawString(100, y - 60, f"BIC: {invoice_data['payment_details']['bic']}")
-    c.drawString(100, y - 80, f"Reference: {invoice_data['payment_details']['reference']}")
+def create_pdf_invoice(invoice_data):
+    currency = invoice_data["currency"]
+    payment = invoice_data["payment_details"]
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+
+    # All lines go into a single text object so the content stream gets one
+    # BT/ET block instead of one per line
+    text = c.beginText(100, 750)
+    text.setLeading(20)
+    text.textLine(f"Invoice #{invoice_data['invoice_number']}")
+    text.textLine(f"Issue Date: {invoice_data['issue_date']}")
+    text.textLine(f"Seller: {invoice_data['seller']['name']}")
+    text.textLine(f"Buyer: {invoice_data['buyer']['name']}")
+    text.textLine(f"Total: {invoice_data['grand_total']} {currency}")
+
+    text.textLines([
+        f"{item['description']} - {item['quantity']} x {item['unit_price']} {currency} (VAT {item['vat_rate']}%)"
+        for item in invoice_data["line_items"]
+    ])
+
+    text.textLine("")
+    text.textLine(f"Payment Details: {payment['bank_name']}")
+    text.textLine(f"IBAN: {payment['iban']}")
+    text.textLine(f"BIC: {payment['bic']}")
+    text.textLine(f"Reference: {payment['reference']}")
+    c.drawText(text)
     c.save()
+    buffer.seek(0)
+    return buffer
 
 # 4. Embed XML into PDF (PDF/A-3)
-def embed_xml_to_pdf(pdf_path, xml_path, output_pdf):
-    pdf = pikepdf.Pdf.open(pdf_path)
-    pdf.attachments[XML_FILENAME] = pikepdf.Attachment(xml_path, description="ZUGFeRD Invoice XML")
-    pdf.save(output_pdf)
+def embed_xml_to_pdf(pdf_buffer, xml_data, output_pdf):
+    pdf = pikepdf.Pdf.open(pdf_buffer)
+    pdf.attachments[XML_FILENAME] = pikepdf.AttachedFileSpec(
+        pdf, xml_data, description="ZUGFeRD Invoice XML", filename=XML_FILENAME
+    )
+    pdf.save(output_pdf, object_stream_mode=pikepdf.ObjectStreamMode.generate, compress_streams=True)
+
+# 5. Generate one complete ZUGFeRD invoice
+def generate_invoice(invoice_data, output_pdf):
+    xml_data = create_zugferd_xml(invoice_data)
+    pdf_buffer = create_pdf_invoice(invoice_data)
+    embed_xml_to_pdf(pdf_buffer, xml_data, output_pdf)
+
+# 6. Generate many invoices in parallel, one worker process per core
+def generate_many(invoices, output_pdfs, max_workers=None):
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(generate_invoice, invoices, output_pdfs))
 
 # Run all steps
 if __name__ == "__main__":
@@ -78,12 +135,12 @@ if __name__ == "__main__":
     invoice_data = load_invoice_data(INPUT_JSON)
 
     print("Generating ZUGFeRD XML...")
-    create_zugferd_xml(invoice_data, XML_FILENAME)
+    xml_data = create_zugferd_xml(invoice_data)
 
     print("Generating PDF Invoice...")
-    create_pdf_invoice(invoice_data, PDF_FILENAME)
+    pdf_buffer = create_pdf_invoice(invoice_data)
 
     print("Embedding XML into PDF...")
-    embed_xml_to_pdf(PDF_FILENAME, XML_FILENAME, OUTPUT_PDF)
+    embed_xml_to_pdf(pdf_buffer, xml_data, OUTPUT_PDF)
 
     print(f"✅ ZUGFeRD Invoice created: {OUTPUT_PDF}")